@@ -1,9 +1,15 @@
 # app.py
+from pathlib import Path
+
 import pandas as pd
 import numpy as np
+import pyarrow.dataset as ds
 import streamlit as st
 import plotly.express as px
 
+# copy-on-write: recortes e assign compartilham memória sem precisar de .copy() defensivo
+pd.options.mode.copy_on_write = True
+
 # =========================
 # CONFIG
 # =========================
@@ -13,56 +19,24 @@ st.set_page_config(
     layout="wide",
 )
 
-CSV_PATH = "base_dashboard_irpf_2020_2023.csv"
+DATA_PATH = "base_dashboard_irpf_2020_2023.parquet"  # gerado por converter_parquet.py
+CSS_PATH = Path(__file__).parent / ".streamlit" / "style.css"
 OCUP_JUD = "Membro do Poder Judiciário e de Tribunal de Contas"
 ANO_MIN = 2021  # remove 2020
+# só as somas são lidas; razões (renda média, % isento, alíquotas) são recalculadas
+# a partir delas, ponderadas, em vez de usar as razões linha a linha do arquivo
+NUM_COLS = ["qtde_contribuintes", "rend_total", "rend_isentos_e_nao_tributaveis", "imposto_pago", "imposto_devido_total"]
 
 # =========================
 # ESTILO (leve, bonito, sem exagero)
 # =========================
-st.markdown(
-    """
-    <style>
-      .block-container { padding-top: 1.2rem; padding-bottom: 2.5rem; }
-      h1, h2, h3 { letter-spacing: -0.02em; }
-      .bigline {
-        font-size: 34px;
-        font-weight: 800;
-        line-height: 1.08;
-        margin: 0.2rem 0 0.6rem 0;
-      }
-      .subline {
-        font-size: 14px;
-        opacity: 0.75;
-        margin-top: -0.2rem;
-      }
-      .card {
-        padding: 16px 18px;
-        border: 1px solid rgba(0,0,0,0.08);
-        border-radius: 16px;
-        background: rgba(255,255,255,0.7);
-        box-shadow: 0 2px 10px rgba(0,0,0,0.04);
-      }
-      .muted { opacity: 0.75; }
-      .kpi {
-        font-size: 44px;
-        font-weight: 900;
-        letter-spacing: -0.02em;
-        margin: 0;
-      }
-      .kpi_label {
-        font-size: 14px;
-        opacity: 0.78;
-        margin-top: -6px;
-      }
-      .note {
-        font-size: 12px;
-        opacity: 0.7;
-      }
-    </style>
-    """,
-    unsafe_allow_html=True,
-)
+# CSS lido do disco uma vez por processo. A tag <style> ainda é emitida a cada rerun:
+# elementos não reenviados somem da página, o que levaria o estilo junto
+@st.cache_resource(show_spinner=False)
+def load_css(path):
+    return Path(path).read_text(encoding="utf-8")
+
+st.markdown(f"<style>{load_css(CSS_PATH)}</style>", unsafe_allow_html=True)
 
 # =========================
 # HELPERS
@@ -82,29 +56,59 @@ def fmt_x(x, casas=1):
         return "—"
     return f"{x:.{casas}f}x"
 
-def safe_div(a, b):
-    return np.nan if (b is None or b == 0 or pd.isna(b)) else a / b
+def mascara_anos(ano_base, anos, ano_max):
+    # tabela booleana indexada pelo próprio ano: um gather no lugar do hash do isin
+    tabela = np.zeros(ano_max + 1, dtype=bool)
+    tabela[list(anos)] = True
+    return tabela[ano_base.to_numpy()]
 
 # =========================
 # LOAD
 # =========================
-@st.cache_data
+# cache_resource devolve o mesmo objeto sem hashear/copiar o DataFrame a cada rerun;
+# por isso o df é somente leitura: nada abaixo pode alterá-lo in place
+@st.cache_resource(show_spinner=False)
 def load_data(path):
-    df = pd.read_csv(path)
-    df["ano_base"] = df["ano_base"].astype(int)
-    df["uf"] = df["uf"].astype(str)
-    df["ocupacao_principal"] = df["ocupacao_principal"].astype(str)
-    return df
+    # uf/ocupação já vêm como category e ano_base como int16 (ver converter_parquet.py);
+    # o filtro de ano é aplicado na leitura, então 2020 nem chega a ser materializado
+    dataset = ds.dataset(path, format="parquet")
+    df = dataset.to_table(
+        columns=["ano_base", "uf", "ocupacao_principal"] + NUM_COLS,
+        filter=ds.field("ano_base") >= ANO_MIN,
+    ).to_pandas()
+    # somas ficam em float64: rend_total chega a 2,3e13, onde o passo do float32 é ~R$ 2 mi
+    # UFs/ocupações que só existiam em 2020 continuam como categoria após o filtro; descartá-las
+    for c in ["uf", "ocupacao_principal"]:
+        df[c] = df[c].cat.remove_unused_categories()
+    # índice ordenado (uf, ocupação): lookup direto no lugar de máscaras booleanas
+    df = df.set_index(["uf", "ocupacao_principal"]).sort_index()
+
+    # listas dos filtros dependem só do arquivo: calculadas uma vez aqui, não a cada rerun
+    # (categorias já vêm ordenadas alfabeticamente e só com valores presentes após o filtro)
+    ufs = df.index.get_level_values("uf").categories.tolist()
+    ocupacoes = df.index.get_level_values("ocupacao_principal").categories.tolist()
+    anos_disponiveis = sorted(df["ano_base"].unique().tolist())
+    return df, ufs, ocupacoes, anos_disponiveis
+
+@st.cache_resource(show_spinner=False)
+def ocup_por_uf(_df):
+    # uf -> ocupações presentes, calculado uma vez em vez de varrer o df a cada rerun
+    return {
+        u: sorted(g.index.get_level_values("ocupacao_principal").unique().tolist())
+        for u, g in _df.groupby(level="uf", observed=True)
+    }
+
+@st.cache_resource(show_spinner=False)
+def somas_todos_anos(_df):
+    # somas por (uf, ocupação) com todos os anos, para a seleção padrão do filtro de anos
+    return _df.groupby(level=["uf", "ocupacao_principal"], observed=True)[NUM_COLS].sum()
 
 try:
-    df = load_data(CSV_PATH)
+    df, ufs, ocupacoes, anos_disponiveis = load_data(DATA_PATH)
 except Exception as e:
-    st.error(f"Não consegui ler o arquivo {CSV_PATH}. Erro: {e}")
+    st.error(f"Não consegui ler o arquivo {DATA_PATH}. Erro: {e}")
     st.stop()
 
-# Remove 2020
-df = df[df["ano_base"] >= ANO_MIN].copy()
-
 # =========================
 # HEADER
 # =========================
@@ -117,76 +121,97 @@ st.markdown(
 # =========================
 # SIDEBAR CONTROLS
 # =========================
-ufs = sorted(df["uf"].unique().tolist())
-ocupacoes = sorted(df["ocupacao_principal"].unique().tolist())
-
 with st.sidebar:
     st.header("Filtros")
     uf_sel = st.selectbox("UF", ufs, index=ufs.index("São Paulo") if "São Paulo" in ufs else 0)
 
     # ocupações disponíveis na UF escolhida
-    ocup_uf = sorted(df.loc[df["uf"] == uf_sel, "ocupacao_principal"].unique().tolist())
+    ocup_uf = ocup_por_uf(df)[uf_sel]
     # remover a ocupação do judiciário da lista do usuário (para evitar comparar judiciário vs judiciário)
     ocup_uf_user = [o for o in ocup_uf if o != OCUP_JUD]
 
     ocup_sel = st.selectbox("Sua ocupação", ocup_uf_user, index=0)
 
-    anos_disponiveis = sorted(df["ano_base"].unique().tolist())
     anos_sel = st.multiselect("Anos (para 'em média')", anos_disponiveis, default=anos_disponiveis)
 
     st.markdown("---")
     st.caption("Obs.: 2020 foi removido por outliers/estranhezas na série.")
 
+# =========================
+# AGREGAR "EM MÉDIA" (ponderado)
+# - renda média por contribuinte: soma(rend_total) / soma(contribuintes)
+# - % isento: soma(isento) / soma(rend_total)
+# - alíquota efetiva paga: soma(imposto_pago)/soma(rend_total)
+# =========================
+def razoes_ponderadas(sums):
+    # recebe somas de NUM_COLS (uma linha por grupo) e devolve totais + razões,
+    # todas calculadas de uma vez sobre o array em vez de coluna a coluna
+    arr = sums.to_numpy()
+    contrib, rend = arr[:, 0], arr[:, 1]
+    # divisão mascarada: onde o denominador é 0/NaN o resultado fica NaN, sem ramificar
+    renda_media = np.divide(rend, contrib, out=np.full_like(rend, np.nan), where=(contrib != 0) & ~np.isnan(contrib))
+    # isento, pago e devido sobre rend_total: pct_isento, aliq_paga, aliq_devida
+    por_rend = np.divide(
+        arr[:, 2:], rend[:, None],
+        out=np.full_like(arr[:, 2:], np.nan),
+        where=((rend != 0) & ~np.isnan(rend))[:, None],
+    )
+    isento_medio = renda_media * por_rend[:, 0]
+
+    return pd.DataFrame(
+        np.column_stack([arr, renda_media, por_rend, isento_medio]),
+        index=sums.index,
+        columns=[
+            "tot_contrib", "tot_rend", "tot_isento", "tot_pago", "tot_devido",
+            "renda_media", "pct_isento", "aliq_paga", "aliq_devida", "isento_medio",
+        ],
+    )
+
+def agregados_ponderados(d_part, by="ocupacao_principal"):
+    # um único groupby soma todas as ocupações do recorte de uma vez
+    return razoes_ponderadas(d_part.groupby(by, observed=True)[NUM_COLS].sum())
+
+def so_grupos(part, ocup):
+    # linhas da ocupação do usuário + Judiciário (qualquer uma pode não existir na UF)
+    return part[part.index.isin([ocup, OCUP_JUD])]
+
+def recorte(uf, ocup, anos):
+    # linhas da ocupação do usuário + Judiciário na UF, nos anos selecionados
+    part = so_grupos(df.loc[uf], ocup)
+    return part[mascara_anos(part["ano_base"], anos, anos_disponiveis[-1])]
+
+@st.cache_data(show_spinner=False, ttl=None, max_entries=128)
+def aggregate(uf, ocup, anos):
+    if set(anos) == set(anos_disponiveis):
+        # caso padrão (todos os anos): somas já prontas, sem filtrar nem agrupar
+        stats = razoes_ponderadas(so_grupos(somas_todos_anos(df).loc[uf], ocup))
+    else:
+        stats = agregados_ponderados(recorte(uf, ocup, anos))
+    # None quando o grupo não tem linhas na UF/anos selecionados
+    return tuple(stats.loc[o].to_dict() if o in stats.index else None for o in (ocup, OCUP_JUD))
+
+@st.cache_data(show_spinner=False, ttl=None, max_entries=128)
+def serie_anual(uf, ocup, anos):
+    stats = agregados_ponderados(recorte(uf, ocup, anos), by=["ano_base", "ocupacao_principal"]).reset_index()
+    stats["grupo"] = np.where(stats["ocupacao_principal"] == OCUP_JUD, "Judiciário", ocup)
+    return stats[["ano_base", "renda_media", "pct_isento", "aliq_paga", "grupo"]].sort_values(["ano_base", "grupo"])
+
 # =========================
 # DATA FILTERED
 # =========================
-d = df[(df["uf"] == uf_sel) & (df["ano_base"].isin(anos_sel))].copy()
+anos_key = tuple(sorted(anos_sel))
 
-d_user = d[d["ocupacao_principal"] == ocup_sel].copy()
-d_jud  = d[d["ocupacao_principal"] == OCUP_JUD].copy()
+agg_user, agg_jud = aggregate(uf_sel, ocup_sel, anos_key)
 
-if d_user.empty:
+if agg_user is None:
     st.warning("Não encontrei dados para essa ocupação/UF/anos selecionados.")
     st.stop()
-if d_jud.empty:
+if agg_jud is None:
     st.warning(f"Não encontrei dados do Judiciário para UF={uf_sel} nos anos selecionados.")
     st.stop()
 
-# =========================
-# AGREGAR "EM MÉDIA" (ponderado)
-# - renda média por contribuinte: soma(rend_total) / soma(contribuintes)
-# - % isento: soma(isento) / soma(rend_total)
-# - alíquota efetiva paga: soma(imposto_pago)/soma(rend_total)
-# =========================
-def agregados_ponderados(df_part):
-    tot_contrib = df_part["qtde_contribuintes"].sum()
-    tot_rend = df_part["rend_total"].sum()
-    tot_isento = df_part["rend_isentos_e_nao_tributaveis"].sum()
-    tot_pago = df_part["imposto_pago"].sum()
-    tot_devido = df_part["imposto_devido_total"].sum()
-
-    renda_media = safe_div(tot_rend, tot_contrib)
-    pct_isento = safe_div(tot_isento, tot_rend)
-    aliq_paga = safe_div(tot_pago, tot_rend)
-    aliq_devida = safe_div(tot_devido, tot_rend)
-
-    return {
-        "tot_contrib": tot_contrib,
-        "tot_rend": tot_rend,
-        "tot_isento": tot_isento,
-        "tot_pago": tot_pago,
-        "tot_devido": tot_devido,
-        "renda_media": renda_media,
-        "pct_isento": pct_isento,
-        "aliq_paga": aliq_paga,
-        "aliq_devida": aliq_devida,
-        "isento_medio": (renda_media * pct_isento) if (not pd.isna(renda_media) and not pd.isna(pct_isento)) else np.nan
-    }
-
-agg_user = agregados_ponderados(d_user)
-agg_jud  = agregados_ponderados(d_jud)
-
-ratio_renda = safe_div(agg_jud["renda_media"], agg_user["renda_media"])
+with np.errstate(divide="ignore", invalid="ignore"):
+    ratio_renda = np.divide(agg_jud["renda_media"], agg_user["renda_media"])  # 0 → inf/NaN, exibidos como "—"
 dif_aliq_paga_pp = (agg_jud["aliq_paga"] - agg_user["aliq_paga"]) * 100 if (not pd.isna(agg_jud["aliq_paga"]) and not pd.isna(agg_user["aliq_paga"])) else np.nan
 
 # =========================
@@ -242,43 +267,23 @@ with colB:
     )
     st.markdown("</div>", unsafe_allow_html=True)
 
-# =========================
-# SERIES (ano a ano)
-# =========================
-# juntar user + jud por ano
-series_cols = ["ano_base", "rend_total_por_contrib", "pct_isento", "aliq_efetiva_paga"]
-
-u = d_user[series_cols].rename(columns={
-    "rend_total_por_contrib": "renda_media",
-    "pct_isento": "pct_isento",
-    "aliq_efetiva_paga": "aliq_paga"
-}).copy()
-u["grupo"] = ocup_sel
-
-j = d_jud[series_cols].rename(columns={
-    "rend_total_por_contrib": "renda_media",
-    "pct_isento": "pct_isento",
-    "aliq_efetiva_paga": "aliq_paga"
-}).copy()
-j["grupo"] = "Judiciário"
-
-s = pd.concat([u, j], ignore_index=True).sort_values(["ano_base", "grupo"])
-
-# pivot para razão anual (Jud / User)
-pivot = s.pivot_table(index="ano_base", columns="grupo", values="renda_media", aggfunc="mean").reset_index()
-if "Judiciário" in pivot.columns and ocup_sel in pivot.columns:
-    pivot["vezes_mais"] = pivot["Judiciário"] / pivot[ocup_sel]
-else:
-    pivot["vezes_mais"] = np.nan
-
 # =========================
 # CHARTS
 # =========================
-st.markdown("## 📈 Séries temporais (UF selecionada)")
-
-cL, cR = st.columns(2, gap="large")
+# figuras ficam em cache como dict (mesma chave das séries), sem reconstruir o px.line a cada rerun
+@st.cache_data(show_spinner=False, ttl=None, max_entries=128)
+def fig_vezes(uf, ocup, anos):
+    # juntar user + jud por ano (razões ponderadas recalculadas das somas)
+    s = serie_anual(uf, ocup, anos)
+
+    # pivot para razão anual (Jud / User)
+    # uma linha por (ano, grupo): basta remodelar, sem passar pela agregação do pivot_table
+    pivot = s.set_index(["ano_base", "grupo"])["renda_media"].unstack("grupo").reset_index()
+    if "Judiciário" in pivot.columns and ocup in pivot.columns:
+        pivot["vezes_mais"] = pivot["Judiciário"] / pivot[ocup]
+    else:
+        pivot["vezes_mais"] = np.nan
 
-with cL:
     # gráfico 1: quantas vezes mais
     fig1 = px.line(
         pivot,
@@ -288,9 +293,12 @@ with cL:
         title="Quantas vezes o Judiciário recebeu mais (média por contribuinte)"
     )
     fig1.update_layout(xaxis_title="Ano-base", yaxis_title="Vezes (Judiciário / Você)")
-    st.plotly_chart(fig1, use_container_width=True)
+    return fig1.to_dict()
+
+@st.cache_data(show_spinner=False, ttl=None, max_entries=128)
+def fig_isento(uf, ocup, anos):
+    s = serie_anual(uf, ocup, anos)
 
-with cR:
     # gráfico 2: % isento (duas linhas)
     fig2 = px.line(
         s,
@@ -302,19 +310,38 @@ with cR:
     )
     fig2.update_layout(xaxis_title="Ano-base", yaxis_title="% isento")
     fig2.update_yaxes(tickformat=".0%")
-    st.plotly_chart(fig2, use_container_width=True)
+    return fig2.to_dict()
+
+st.markdown("## 📈 Séries temporais (UF selecionada)")
+
+cL, cR = st.columns(2, gap="large")
+
+with cL:
+    st.plotly_chart(fig_vezes(uf_sel, ocup_sel, anos_key), use_container_width=True)
+
+with cR:
+    st.plotly_chart(fig_isento(uf_sel, ocup_sel, anos_key), use_container_width=True)
 
 # =========================
 # TABELA (opcional, útil para transparência)
 # =========================
+s = serie_anual(uf_sel, ocup_sel, anos_key)
+
 with st.expander("Ver tabela ano a ano (transparência)"):
     # montar tabela amigável
-    t = s.copy()
-    t["renda_media"] = t["renda_media"].map(lambda x: fmt_moeda(x))
-    t["pct_isento"] = t["pct_isento"].map(lambda x: fmt_pct(x, 1))
-    t["aliq_paga"] = t["aliq_paga"].map(lambda x: fmt_pct(x, 1))
+    # colunas continuam numéricas; a formatação fica por conta do column_config no frontend
+    t = s.assign(pct_isento=s["pct_isento"] * 100, aliq_paga=s["aliq_paga"] * 100)
     t = t.rename(columns={"ano_base": "Ano", "grupo": "Grupo", "renda_media": "Renda média", "pct_isento": "% isento", "aliq_paga": "Alíquota paga"})
-    st.dataframe(t[["Ano", "Grupo", "Renda média", "% isento", "Alíquota paga"]], use_container_width=True)
+    st.dataframe(
+        t[["Ano", "Grupo", "Renda média", "% isento", "Alíquota paga"]],
+        use_container_width=True,
+        column_config={
+            "Ano": st.column_config.NumberColumn(format="%d"),
+            "Renda média": st.column_config.NumberColumn(format="R$ %'.,.0f"),  # separador de milhar "." como em fmt_moeda
+            "% isento": st.column_config.NumberColumn(format="%.1f%%"),
+            "Alíquota paga": st.column_config.NumberColumn(format="%.1f%%"),
+        },
+    )
 
 st.markdown(
     """
@@ -0,0 +1,15 @@
+# converter_parquet.py
+# Conversão única do CSV para Parquet (lido pelo app.py).
+# Uso: python converter_parquet.py
+import pandas as pd
+
+CSV_PATH = "base_dashboard_irpf_2020_2023.csv"
+PARQUET_PATH = "base_dashboard_irpf_2020_2023.parquet"
+
+df = pd.read_csv(CSV_PATH)
+df["ano_base"] = df["ano_base"].astype("int16")
+df["uf"] = df["uf"].astype(str).astype("category")
+df["ocupacao_principal"] = df["ocupacao_principal"].astype(str).astype("category")
+
+df.to_parquet(PARQUET_PATH, engine="pyarrow", compression="zstd", index=False)
+print(f"{PARQUET_PATH}: {len(df)} linhas")